@@ -1,11 +1,17 @@
 # https://words.filippo.io/dispatches/kyber-math/
 # https://nvlpubs.nist.gov/nistpubs/FIPS/NIST.FIPS.203.ipd.pdf
 
-from typing import List, Tuple
+from typing import Callable, List, Tuple
 import hashlib
 import os
+import numpy as np
 from shakestream import ShakeStream
-from functools import reduce
+from functools import lru_cache
+
+try:
+	import numba
+except ImportError:
+	numba = None # optional, everything still works without it (just slower)
 
 # ML-KEM-768 params:
 N = 256
@@ -20,15 +26,57 @@ def bitrev7(n: int) -> int:
 	return int(f"{n:07b}"[::-1], 2)  # gross but it works
 
 # 17 is primitive 256th root of unity mod Q
-ZETA = [pow(17, bitrev7(k), Q) for k in range(128)] # used in ntt and ntt_inv
-GAMMA = [pow(17, 2*bitrev7(k)+1, Q) for k in range(128)] # used in ntt_mul
+# ZETA[k] = 17**bitrev7(k) and GAMMA[k] = 17**(2*bitrev7(k)+1) = 17 * ZETA[k]**2
+# (all mod Q), built from a table of consecutive powers rather than with pow()
+_POW17 = [1]
+for _ in range(127):
+	_POW17.append(_POW17[-1] * 17 % Q)
+ZETA = np.array([_POW17[bitrev7(k)] for k in range(128)], dtype=np.int32) # used in ntt and ntt_inv
+GAMMA = np.array([17 * z * z % Q for z in ZETA.tolist()], dtype=np.int32) # used in ntt_mul
+
+# The zetas used by each layer of the NTT, in the order they get used.
+# Layer s (with 2**s blocks of length 128 >> s) uses ZETA[2**s:2**(s+1)], one
+# per block, and they're shaped (blocks, 1) so that they broadcast across each
+# block. The inverse NTT uses the same zetas but in the opposite order.
+NTT_LAYER_ZETAS = [np.ascontiguousarray(ZETA[2**s:2**(s+1), None]) for s in range(7)]
+NTT_INV_LAYER_ZETAS = [np.ascontiguousarray(z[::-1]) for z in NTT_LAYER_ZETAS]
+
+# The inverse NTT has to divide by 128 at the end, which we fold into its final
+# layer (which only has one block, and hence one zeta) instead of doing a
+# separate pass. 3303 == pow(128, -1, Q)
+INV_128 = 3303
+NTT_INV_LAST_ZETA = int(ZETA[1]) * INV_128 % Q
+
+# The same again, but grouped up for the radix-4 layer pairs, as (z1, z2, z3)
+# where z1 is for the first layer of the pair, and z2, z3 are for the first and
+# second half of each block in the other layer.
+NTT_RADIX4_ZETAS = [
+	(NTT_LAYER_ZETAS[s], NTT_LAYER_ZETAS[s + 1][0::2].copy(), NTT_LAYER_ZETAS[s + 1][1::2].copy())
+	for s in (0, 2, 4) # layer pairs (128, 64), (32, 16), (8, 4)
+]
+NTT_INV_RADIX4_ZETAS = [
+	(NTT_INV_LAYER_ZETAS[s - 1], NTT_INV_LAYER_ZETAS[s][0::2].copy(), NTT_INV_LAYER_ZETAS[s][1::2].copy())
+	for s in (6, 4, 2) # layer pairs (2, 4), (8, 16), (32, 64)
+]
+
+# x mod Q ~= x - ((x * BARRETT_M) >> 24) * Q, off by at most one Q for 0 <= x < 2*Q*Q
+# (so it's only valid for x in that range: a product of two 12-bit values is
+# fine, but a sum of two such products isn't)
+BARRETT_M = (1 << 24) // Q
+
+# polynomials are represented as int32 numpy arrays of 256 coefficients.
+# (any product of two reduced coefficients is < Q*Q, which fits comfortably)
+def poly256(f) -> np.ndarray:
+	return np.asarray(f, dtype=np.int32)
 
 # can be reused for NTT representatives
-def poly256_add(a: List[int], b: List[int]) -> List[int]:
-	return [(x + y) % Q for x, y in zip(a, b)]
+# the inputs must already be reduced (0 <= a, b < Q), since the numba versions
+# only do a single conditional add/subtract.
+def poly256_add(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+	return (poly256(a) + poly256(b)) % Q
 
-def poly256_sub(a: List[int], b: List[int]) -> List[int]:
-	return [(x - y) % Q for x, y in zip(a, b)]
+def poly256_sub(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+	return (poly256(a) - poly256(b)) % Q
 
 # naive O(n^2) multiplication algorithm for testing/comparison purposes.
 # this is not used for the main impl.
@@ -50,50 +98,90 @@ def poly256_slow_mul(a: List[int], b: List[int]) -> List[int]:
 
 
 # by the way, this is O(n logn)
-def ntt(f_in: List[int]) -> List[int]:
-	f_out = f_in.copy()
-	k = 1
-	for log2len in range(7, 0, -1):
-		length = 2**log2len
-		for start in range(0, 256, 2 * length):
-			zeta = ZETA[k]
-			k += 1
-			for j in range(start, start + length):
-				t = (zeta * f_out[j + length]) % Q
-				f_out[j + length] = (f_out[j] - t) % Q
-				f_out[j] = (f_out[j] + t) % Q
-	return f_out
+# Each layer is done in one go, by viewing the array as (blocks, 2, length)
+# so that the butterflies become whole-array ops on the two halves of every block.
+# Pairs of adjacent layers are merged into radix-4 butterflies: we view the
+# array as (blocks, 4, length), load all four quarters a, b, c, d of each block,
+# do both layers' worth of butterflies on them, and only then write them back.
+# The sums and differences are left unreduced (only the products get reduced),
+# which is fine since they grow by at most Q per layer, and int32 has plenty
+# of headroom for that.
+# This also works on a whole stack of polynomials, shape (n, 256), doing all n
+# NTTs at once (the zetas broadcast across the extra axis too).
+def ntt(f_in: np.ndarray) -> np.ndarray:
+	f_out = np.array(f_in, dtype=np.int32)
+	for z1, z2, z3 in NTT_RADIX4_ZETAS:
+		blocks = len(z1)
+		f = f_out.reshape(-1, blocks, 4, 64 // blocks)
+		a, b, c, d = f[..., 0, :], f[..., 1, :], f[..., 2, :], f[..., 3, :]
+		t1 = z1 * c % Q
+		t2 = z1 * d % Q
+		a, c = a + t1, a - t1
+		b, d = b + t2, b - t2
+		t3 = z2 * b % Q
+		t4 = z3 * d % Q
+		np.add(a, t3, out=f[..., 0, :])
+		np.subtract(a, t3, out=f[..., 1, :])
+		np.add(c, t4, out=f[..., 2, :])
+		np.subtract(c, t4, out=f[..., 3, :])
+
+	# and the odd one out, the final layer (length 2)
+	f = f_out.reshape(-1, 64, 2, 2)
+	t = NTT_LAYER_ZETAS[6] * f[..., 1, :] % Q
+	f[..., 1, :] = f[..., 0, :] - t
+	f[..., 0, :] += t
+	return f_out % Q
 
 
 # so is this
-def ntt_inv(f_in: List[int]) -> List[int]:
-	f_out = f_in.copy()
-	k = 127
-	for log2len in range(1, 8):
-		length = 2**log2len
-		for start in range(0, 256, 2 * length):
-			zeta = ZETA[k]
-			k -= 1
-			for j in range(start, start + length):
-				t = f_out[j]
-				f_out[j] = (t + f_out[j + length]) % Q
-				f_out[j + length] = (zeta * (f_out[j + length] - t)) % Q
-
-	for i in range(256):
-		f_out[i] = (f_out[i] * 3303) % Q  # 3303 == pow(128, -1, Q)
-
+# (here the sums double each layer, rather than growing by Q, but that's
+# still < 128*Q by the end)
+def ntt_inv(f_in: np.ndarray) -> np.ndarray:
+	f_out = np.array(f_in, dtype=np.int32)
+	for z1, z2, z3 in NTT_INV_RADIX4_ZETAS:
+		blocks = len(z1)
+		f = f_out.reshape(-1, blocks, 4, 64 // blocks)
+		a, b, c, d = f[..., 0, :], f[..., 1, :], f[..., 2, :], f[..., 3, :]
+		a, b = a + b, z2 * (b - a) % Q
+		c, d = c + d, z3 * (d - c) % Q
+		np.add(a, c, out=f[..., 0, :])
+		np.add(b, d, out=f[..., 1, :])
+		np.multiply(z1, c - a, out=f[..., 2, :])
+		np.multiply(z1, d - b, out=f[..., 3, :])
+		np.remainder(f[..., 2:, :], Q, out=f[..., 2:, :])
+
+	# and the odd one out, the final layer (length 128), which also divides by 128
+	# (note 128*Q*INV_128 < 2**31)
+	a, b = f_out[..., :128], f_out[..., 128:]
+	b_out = NTT_INV_LAST_ZETA * (b - a) % Q
+	f_out[..., :128] = (a + b) * INV_128 % Q
+	f_out[..., 128:] = b_out
 	return f_out
 
 ntt_add = poly256_add  # it's just elementwise addition
 
 # and this is just O(n)
-def ntt_mul(a: List[int], b: List[int]) -> List[int]:
-	c = []
-	for i in range(128):
-		a0, a1 = a[2 * i: 2 * i + 2]
-		b0, b1 = b[2 * i: 2 * i + 2]
-		c.append((a0 * b0 + a1 * b1 * GAMMA[i]) % Q)
-		c.append((a0 * b1 + a1 * b0) % Q)
+def ntt_mul(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+	a, b = poly256(a), poly256(b)
+	a0, a1 = a[0::2], a[1::2]
+	b0, b1 = b[0::2], b[1::2]
+	c = np.empty(256, dtype=np.int32)
+	c[0::2] = (a0 * b0 + a1 * b1 % Q * GAMMA) % Q
+	c[1::2] = (a0 * b1 + a1 * b0) % Q
+	return c
+
+# matrix-vector product of NTT representatives, i.e. for each row i, the sum
+# over j of ntt_mul(A[i][j], x[j]), for all the rows at once.
+# the products are accumulated in int64 (each is < Q**3, so there's plenty of
+# headroom) and only get reduced once, at the end.
+def ntt_matvec(A: np.ndarray, x: np.ndarray) -> np.ndarray:
+	A = np.asarray(A, dtype=np.int64)
+	x = np.asarray(x, dtype=np.int64)
+	a0, a1 = A[..., 0::2], A[..., 1::2]
+	x0, x1 = x[:, 0::2], x[:, 1::2]
+	c = np.empty((len(A), 256), dtype=np.int32)
+	c[:, 0::2] = (a0 * x0 + a1 * x1 * GAMMA).sum(axis=1) % Q
+	c[:, 1::2] = (a0 * x1 + a1 * x0).sum(axis=1) % Q
 	return c
 
 
@@ -103,7 +191,27 @@ def mlkem_prf(eta: int, data: bytes, b: int) -> bytes:
 	return hashlib.shake_256(data + bytes([b])).digest(64 * eta)
 
 def mlkem_xof(data: bytes, i: int, j: int) -> ShakeStream:
-	return ShakeStream(hashlib.shake_128(data + bytes([i, j])).digest)
+	return ShakeStream(hashlib.shake_128(data + bytes([i, j])))
+
+# the PRF and XOF always get called several times with the same data and only
+# the trailing index byte(s) changing, so these absorb the data just once, and
+# then copy that state for each call.
+
+def mlkem_prf_seeded(eta: int, data: bytes) -> Callable[[int], bytes]:
+	base = hashlib.shake_256(data)
+	def prf(b: int) -> bytes:
+		h = base.copy()
+		h.update(bytes([b]))
+		return h.digest(64 * eta)
+	return prf
+
+def mlkem_xof_seeded(data: bytes) -> Callable[[int, int], ShakeStream]:
+	base = hashlib.shake_128(data)
+	def xof(i: int, j: int) -> ShakeStream:
+		h = base.copy()
+		h.update(bytes([i, j]))
+		return ShakeStream(h)
+	return xof
 
 def mlkem_hash_H(data: bytes) -> bytes:
 	return hashlib.sha3_256(data).digest()
@@ -117,136 +225,417 @@ def mlkem_hash_G(data: bytes) -> bytes:
 
 # encode/decode logic
 
-def bits_to_bytes(bits: List[int]) -> bytes:
+# bits are little-endian within each byte, and within each d-bit coefficient
+
+def bits_to_bytes(bits: np.ndarray) -> bytes:
 	assert(len(bits) % 8 == 0)
-	return bytes(
-		sum(bits[i + j] << j for j in range(8))
-		for i in range(0, len(bits), 8)
-	)
-
-def bytes_to_bits(data: bytes) -> List[int]:
-	bits = []
-	for word in data:
-		for i in range(8):
-			bits.append((word >> i) & 1)
-	return bits
-
-def byte_encode(d: int, f: List[int]) -> bytes:
+	return np.packbits(np.asarray(bits, dtype=np.uint8), bitorder="little").tobytes()
+
+def bytes_to_bits(data: bytes) -> np.ndarray:
+	return np.unpackbits(np.frombuffer(data, dtype=np.uint8), bitorder="little").astype(np.int32)
+
+# specialised versions of byte_encode/byte_decode for the values of d that
+# ML-KEM-768 actually uses, which pack whole groups of coefficients that fill a
+# whole number of bytes directly, rather than going via an array of bits.
+# (same layout as the generic version, of course)
+
+def pack12(f: np.ndarray) -> bytes:
+	f = poly256(f).reshape(-1, 2) & 0xfff # 2 coeffs -> 3 bytes
+	out = np.empty((len(f), 3), dtype=np.uint8)
+	out[:, 0] = f[:, 0] & 0xff
+	out[:, 1] = (f[:, 0] >> 8 | f[:, 1] << 4) & 0xff
+	out[:, 2] = f[:, 1] >> 4
+	return out.tobytes()
+
+def pack10(f: np.ndarray) -> bytes:
+	f = poly256(f).reshape(-1, 4) & 0x3ff # 4 coeffs -> 5 bytes
+	out = np.empty((len(f), 5), dtype=np.uint8)
+	out[:, 0] = f[:, 0] & 0xff
+	out[:, 1] = (f[:, 0] >> 8 | f[:, 1] << 2) & 0xff
+	out[:, 2] = (f[:, 1] >> 6 | f[:, 2] << 4) & 0xff
+	out[:, 3] = (f[:, 2] >> 4 | f[:, 3] << 6) & 0xff
+	out[:, 4] = f[:, 3] >> 2
+	return out.tobytes()
+
+def pack4(f: np.ndarray) -> bytes:
+	f = poly256(f).reshape(-1, 2) & 0xf # 2 coeffs -> 1 byte
+	return (f[:, 0] | f[:, 1] << 4).astype(np.uint8).tobytes()
+
+def unpack12(data: bytes) -> np.ndarray:
+	b = np.frombuffer(data, dtype=np.uint8).astype(np.int32).reshape(-1, 3)
+	f = np.empty((len(b), 2), dtype=np.int32)
+	f[:, 0] = b[:, 0] | (b[:, 1] & 0x0f) << 8
+	f[:, 1] = b[:, 1] >> 4 | b[:, 2] << 4
+	return f.ravel()
+
+def unpack10(data: bytes) -> np.ndarray:
+	b = np.frombuffer(data, dtype=np.uint8).astype(np.int32).reshape(-1, 5)
+	f = np.empty((len(b), 4), dtype=np.int32)
+	f[:, 0] = b[:, 0] | (b[:, 1] & 0x03) << 8
+	f[:, 1] = b[:, 1] >> 2 | (b[:, 2] & 0x0f) << 6
+	f[:, 2] = b[:, 2] >> 4 | (b[:, 3] & 0x3f) << 4
+	f[:, 3] = b[:, 3] >> 6 | b[:, 4] << 2
+	return f.ravel()
+
+def unpack4(data: bytes) -> np.ndarray:
+	b = np.frombuffer(data, dtype=np.uint8).astype(np.int32)
+	return np.stack((b & 0xf, b >> 4), axis=1).ravel()
+
+PACK = {4: pack4, 10: pack10, 12: pack12}
+UNPACK = {4: unpack4, 10: unpack10, 12: unpack12}
+
+def byte_encode(d: int, f: np.ndarray) -> bytes:
+	f = poly256(f)
 	assert(len(f) == 256)
-	bits = []
-	for a in f:
-		for i in range(d):
-			bits.append((a >> i) & 1)
-	return bits_to_bytes(bits)
-
-def byte_decode(d: int, data: bytes) -> List[int]:
-	bits = bytes_to_bits(data)
-	return [sum(bits[i * d + j] << j for j in range(d)) for i in range(256)]
-
-def compress(d: int, x: List[int]) -> List[int]:
-	return [(((n * 2**d) + Q // 2 ) // Q) % (2**d) for n in x]
-
-def decompress(d: int, x: List[int]) -> List[int]:
-	return [(((n * Q) + 2**(d-1) ) // 2**d) % Q for n in x]
-
+	if d in PACK:
+		return PACK[d](f)
+	bits = (f[:, None] >> np.arange(d, dtype=np.int32)) & 1 # shape (256, d)
+	return bits_to_bytes(bits.ravel())
+
+def byte_decode(d: int, data: bytes) -> np.ndarray:
+	assert(len(data) == 32 * d)
+	if d in UNPACK:
+		return UNPACK[d](data)
+	bits = bytes_to_bits(data).reshape(256, d)
+	return (bits << np.arange(d, dtype=np.int32)).sum(axis=1, dtype=np.int32)
+
+# (add, mul, shift) for the multiply-and-shift forms of compress used by the
+# Kyber reference implementation (see test_compress.py), which avoid a division.
+# these are only exact for 0 <= x < Q, so x gets reduced first (which doesn't
+# change the result, since adding Q to x adds 2**d before the final mod 2**d)
+COMPRESS_MULSHIFT = {
+	1: (1665, 80635, 28),
+	4: (1665, 80635, 28),
+	5: (1664, 40318, 27),
+	10: (1665, 1290167, 32),
+	11: (1664, 645084, 31),
+}
+
+def compress(d: int, x: np.ndarray) -> np.ndarray:
+	x = np.asarray(x, dtype=np.int64)
+	if d in COMPRESS_MULSHIFT:
+		add, mul, shift = COMPRESS_MULSHIFT[d]
+		y = (((x % Q) << d) + add) * mul >> shift
+	else:
+		y = ((x << d) + Q // 2) // Q
+	return (y & ((1 << d) - 1)).astype(np.int32)
+
+# (written so that d=0 doesn't need a fractional rounding constant)
+def decompress(d: int, x: np.ndarray) -> np.ndarray:
+	x = np.asarray(x, dtype=np.int64)
+	return ((2 * x * Q + (1 << d)) // (2 << d) % Q).astype(np.int32)
+
+# byte_encode(d, compress(d, x)) and decompress(d, byte_decode(d, data)) in one
+# go, for the values of d that ML-KEM-768 uses for ciphertexts and messages.
+# compression uses the multiply-and-shift forms from the Kyber reference
+# implementation (see test_compress.py).
+
+def pack_compressed_10(x: np.ndarray) -> bytes:
+	x = np.asarray(x, dtype=np.int64)
+	return pack10(((x << 10) + 1665) * 1290167 >> 32 & 0x3ff)
+
+def pack_compressed_4(x: np.ndarray) -> bytes:
+	x = np.asarray(x, dtype=np.int64)
+	return pack4(((x << 4) + 1665) * 80635 >> 28 & 0xf)
+
+def pack_compressed_1(x: np.ndarray) -> bytes:
+	x = np.asarray(x, dtype=np.int64)
+	return bits_to_bytes(((x << 1) + 1665) * 80635 >> 28 & 1)
+
+def unpack_compressed_10(data: bytes) -> np.ndarray:
+	return (unpack10(data) * Q + (1 << 9)) >> 10
+
+def unpack_compressed_4(data: bytes) -> np.ndarray:
+	return (unpack4(data) * Q + (1 << 3)) >> 4
+
+def unpack_compressed_1(data: bytes) -> np.ndarray:
+	return bytes_to_bits(data) * ((Q + 1) // 2)
+
+PACK_COMPRESSED = {1: pack_compressed_1, 4: pack_compressed_4, 10: pack_compressed_10}
+UNPACK_COMPRESSED = {1: unpack_compressed_1, 4: unpack_compressed_4, 10: unpack_compressed_10}
+
+def pack_compressed(d: int, x: np.ndarray) -> bytes:
+	if d in PACK_COMPRESSED:
+		return PACK_COMPRESSED[d](x)
+	return byte_encode(d, compress(d, x))
+
+def unpack_compressed(d: int, data: bytes) -> np.ndarray:
+	if d in UNPACK_COMPRESSED:
+		return UNPACK_COMPRESSED[d](data)
+	return decompress(d, byte_decode(d, data))
 
 # sampling
 
-def sample_ntt(xof: ShakeStream):
-	res = []
+# rather than reading 3 bytes at a time, we read enough for 256 coefficients
+# (almost always) in one go, and parse all the 3-byte chunks at once.
+# in the rare case that's not enough, we read another SHAKE-128 block.
+def sample_ntt(xof: ShakeStream) -> np.ndarray:
+	res = np.empty(0, dtype=np.int32)
+	nbytes = 3*256*5//4 + 48
 	while len(res) < 256:
-		a, b, c = xof.read(3)
-		d1 = ((b & 0xf) << 8) | a
-		d2 = c << 4 | b >> 4
-		if d1 < Q:
-			res.append(d1)
-		if d2 < Q and len(res) < 256:
-			res.append(d2)
-	return res
-
-
-def sample_poly_cbd(eta: int, data: bytes) -> List[int]:
+		b = np.frombuffer(xof.read(nbytes), dtype=np.uint8).astype(np.int32).reshape(-1, 3)
+		d = np.empty((len(b), 2), dtype=np.int32)
+		d[:, 0] = ((b[:, 1] & 0xf) << 8) | b[:, 0]
+		d[:, 1] = b[:, 2] << 4 | b[:, 1] >> 4
+		d = d.ravel()
+		res = np.concatenate((res, d[d < Q]))
+		nbytes = 168
+	return res[:256]
+
+
+# For eta=2, each coefficient comes from one 4-bit nibble (2 bits summed, minus
+# 2 bits summed), so we can just look them up in a 16-entry table, two per byte.
+# Likewise for eta=3, with 6 bits per coefficient (i.e. 4 per 3 bytes) and a
+# 64-entry table.
+def _cbd_table(eta: int) -> np.ndarray:
+	mask = (1 << eta) - 1
+	return np.array([
+		(bin(x & mask).count("1") - bin(x >> eta).count("1")) % Q
+		for x in range(1 << (2 * eta))
+	], dtype=np.int32)
+
+CBD2_TABLE = _cbd_table(2)
+CBD3_TABLE = _cbd_table(3)
+
+def sample_poly_cbd_eta2(data: bytes) -> np.ndarray:
+	b = np.frombuffer(data, dtype=np.uint8)
+	return CBD2_TABLE[np.stack((b & 0xf, b >> 4), axis=1).ravel()]
+
+def sample_poly_cbd_eta3(data: bytes) -> np.ndarray:
+	b = np.frombuffer(data, dtype=np.uint8).astype(np.int32).reshape(-1, 3)
+	w = b[:, 0] | b[:, 1] << 8 | b[:, 2] << 16
+	return CBD3_TABLE[(w[:, None] >> np.arange(0, 24, 6)) & 0x3f].ravel()
+
+def sample_poly_cbd(eta: int, data: bytes) -> np.ndarray:
 	assert(len(data) == 64 * eta)
+	if eta == 2:
+		return sample_poly_cbd_eta2(data)
+	if eta == 3:
+		return sample_poly_cbd_eta3(data)
 	bits = bytes_to_bits(data)
 	f = []
 	for i in range(256):
 		x = sum(bits[2*i*eta+j] for j in range(eta))
 		y = sum(bits[2*i*eta+eta+j] for j in range(eta))
 		f.append((x - y) % Q)
-	return f
+	return np.array(f, dtype=np.int32)
+
+
+# If numba is available, swap in JIT-compiled versions of the hot kernels.
+# These are just plain scalar loops over int32 arrays, which is what numba is
+# good at. They take/return numpy arrays.
+
+# Rather than using %, products are reduced with a barrett reduction, and
+# sums/differences of reduced values with a single conditional add/subtract.
+
+if numba is not None:
+	jit = numba.njit(cache=True, boundscheck=False)
+
+	@jit
+	def _barrett_reduce(x):
+		r = x - ((np.int64(x) * BARRETT_M) >> 24) * Q
+		return r - Q if r >= Q else r
+
+	@jit
+	def _poly256_add_jit(a, b):
+		c = np.empty_like(a)
+		for i in range(len(a)):
+			x = a[i] + b[i]
+			c[i] = x - Q if x >= Q else x
+		return c
+
+	@jit
+	def _poly256_sub_jit(a, b):
+		c = np.empty_like(a)
+		for i in range(len(a)):
+			x = a[i] - b[i]
+			c[i] = x + Q if x < 0 else x
+		return c
+
+	@jit
+	def _ntt_jit(f):
+		k = 1
+		length = 128
+		while length >= 2:
+			for start in range(0, 256, 2 * length):
+				zeta = ZETA[k]
+				k += 1
+				for j in range(start, start + length):
+					t = _barrett_reduce(zeta * f[j + length])
+					x = f[j] - t
+					f[j + length] = x + Q if x < 0 else x
+					x = f[j] + t
+					f[j] = x - Q if x >= Q else x
+			length //= 2
+
+	@jit
+	def _ntt_inv_jit(f):
+		k = 127
+		length = 2
+		while length <= 64:
+			for start in range(0, 256, 2 * length):
+				zeta = ZETA[k]
+				k -= 1
+				for j in range(start, start + length):
+					t = f[j]
+					x = t + f[j + length]
+					f[j] = x - Q if x >= Q else x
+					f[j + length] = _barrett_reduce(zeta * (f[j + length] - t + Q))
+			length *= 2
+		for j in range(128):
+			t = f[j]
+			f[j] = _barrett_reduce((t + f[j + 128]) * INV_128)
+			f[j + 128] = _barrett_reduce(NTT_INV_LAST_ZETA * (f[j + 128] - t + Q))
+
+	@jit
+	def _ntt_mul_jit(a, b):
+		c = np.empty(256, dtype=np.int32)
+		for i in range(128):
+			a0, a1 = a[2 * i], a[2 * i + 1]
+			b0, b1 = b[2 * i], b[2 * i + 1]
+			# each product is reduced separately, to stay within the barrett
+			# bound even for unreduced (up to 12-bit) inputs
+			c[2 * i] = _barrett_reduce(_barrett_reduce(a0 * b0) + _barrett_reduce(a1 * b1) * GAMMA[i])
+			c[2 * i + 1] = _barrett_reduce(_barrett_reduce(a0 * b1) + _barrett_reduce(a1 * b0))
+		return c
+
+	@jit
+	def _ntt_matvec_jit(A, x):
+		c = np.empty((A.shape[0], 256), dtype=np.int32)
+		for i in range(A.shape[0]):
+			for k in range(128):
+				c0 = np.int64(0)
+				c1 = np.int64(0)
+				for j in range(A.shape[1]):
+					a0, a1 = np.int64(A[i, j, 2 * k]), np.int64(A[i, j, 2 * k + 1])
+					b0, b1 = x[j, 2 * k], x[j, 2 * k + 1]
+					c0 += a0 * b0 + _barrett_reduce(a1 * b1) * GAMMA[k]
+					c1 += a0 * b1 + a1 * b0
+				c[i, 2 * k] = c0 % Q
+				c[i, 2 * k + 1] = c1 % Q
+		return c
+
+	@jit
+	def _sample_poly_cbd_jit(eta, data):
+		f = np.empty(256, dtype=np.int32)
+		for i in range(256):
+			x = 0
+			for j in range(2 * i * eta, 2 * i * eta + eta):
+				x += (data[j >> 3] >> (j & 7)) & 1
+			for j in range(2 * i * eta + eta, 2 * i * eta + 2 * eta):
+				x -= (data[j >> 3] >> (j & 7)) & 1
+			f[i] = x % Q
+		return f
+
+	# (these work on a single polynomial or a stack of them, like the originals)
+	def poly256_add(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+		a, b = poly256(a), poly256(b)
+		assert(a.shape == b.shape)
+		return _poly256_add_jit(a.ravel(), b.ravel()).reshape(a.shape)
+
+	def poly256_sub(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+		a, b = poly256(a), poly256(b)
+		assert(a.shape == b.shape)
+		return _poly256_sub_jit(a.ravel(), b.ravel()).reshape(a.shape)
+
+	ntt_add = poly256_add
+
+	def ntt(f_in: np.ndarray) -> np.ndarray:
+		f_out = np.array(f_in, dtype=np.int32)
+		for f in f_out.reshape(-1, 256):
+			_ntt_jit(f)
+		return f_out
+
+	def ntt_inv(f_in: np.ndarray) -> np.ndarray:
+		f_out = np.array(f_in, dtype=np.int32)
+		for f in f_out.reshape(-1, 256):
+			_ntt_inv_jit(f)
+		return f_out
+
+	def ntt_mul(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+		return _ntt_mul_jit(poly256(a), poly256(b))
+
+	def ntt_matvec(A: np.ndarray, x: np.ndarray) -> np.ndarray:
+		return _ntt_matvec_jit(poly256(A), poly256(x))
+
+	def sample_poly_cbd(eta: int, data: bytes) -> np.ndarray:
+		assert(len(data) == 64 * eta)
+		return _sample_poly_cbd_jit(eta, np.frombuffer(data, dtype=np.uint8).astype(np.int32))
 
 
 # K-PKE
 
+# Expanding ahat from rho is a lot of SHAKE-128, and the same rho tends to
+# come up repeatedly (e.g. keygen, then encaps, then the re-encryption in
+# decaps, all for the same ek), so we cache it.
+# The result is shared between callers, hence the read-only array.
+@lru_cache(maxsize=4)
+def _expand_A(rho: bytes) -> np.ndarray:
+	xof = mlkem_xof_seeded(rho)
+	ahat = np.empty((K, K, 256), dtype=np.int32)
+	for i in range(K):
+		for j in range(K):
+			ahat[i, j] = sample_ntt(xof(i, j))
+	ahat.setflags(write=False)
+	return ahat
+
+# Similarly, everything kpke_encrypt needs from ek_pke, which means that the
+# re-encryption in mlkem_decaps doesn't redo any of this work for an ek that
+# was recently used for encaps (or just generated).
+@lru_cache(maxsize=4)
+def _expand_ek_pke(ek_pke: bytes) -> Tuple[np.ndarray, np.ndarray]:
+	that = np.array([byte_decode(12, ek_pke[i*128*K:(i+1)*128*K]) for i in range(K)])
+	that.setflags(write=False)
+	rho = ek_pke[-32:]
+	return that, _expand_A(bytes(rho))
+
+
 def kpke_keygen(seed: bytes=None) -> Tuple[bytes, bytes]:
 	d = os.urandom(32) if seed is None else seed
 	ghash = mlkem_hash_G(d)
 	rho, sigma = ghash[:32], ghash[32:]
 
-	ahat = []
-	for i in range(K):
-		row = []
-		for j in range(K):
-			row.append(sample_ntt(mlkem_xof(rho, i, j)))
-		ahat.append(row)
-	
-	shat = [
-		ntt(sample_poly_cbd(ETA1, mlkem_prf(ETA1, sigma, i)))
-		for i in range(K)
-	]
-	ehat = [
-		ntt(sample_poly_cbd(ETA1, mlkem_prf(ETA1, sigma, i+K)))
+	ahat = _expand_A(bytes(rho))
+
+	prf = mlkem_prf_seeded(ETA1, sigma)
+	shat = ntt([
+		sample_poly_cbd(ETA1, prf(i))
 		for i in range(K)
-	]
-	that = [ # t = a * s + e
-		reduce(ntt_add, [
-			ntt_mul(ahat[j][i], shat[j])
-			for j in range(K)
-		] + [ehat[i]])
+	])
+	ehat = ntt([
+		sample_poly_cbd(ETA1, prf(i+K))
 		for i in range(K)
-	]
+	])
+	# t = a * s + e (note that we need the transpose of ahat here)
+	that = ntt_add(ntt_matvec(ahat.transpose(1, 0, 2), shat), ehat)
 	ek_pke = b"".join(byte_encode(12, s) for s in that) + rho
 	dk_pke = b"".join(byte_encode(12, s) for s in shat)
 	return ek_pke, dk_pke
 
 
 def kpke_encrypt(ek_pke: bytes, m: bytes, r: bytes) -> bytes:
-	that = [byte_decode(12, ek_pke[i*128*K:(i+1)*128*K]) for i in range(K)]
-	rho = ek_pke[-32:]
+	that, ahat = _expand_ek_pke(bytes(ek_pke)) # ahat is identical to as in kpke_keygen
 
-	# this is identical to as in kpke_keygen
-	ahat = []
-	for i in range(K):
-		row = []
-		for j in range(K):
-			row.append(sample_ntt(mlkem_xof(rho, i, j)))
-		ahat.append(row)
-	
-	rhat = [
-		ntt(sample_poly_cbd(ETA1, mlkem_prf(ETA1, r, i)))
+	prf1 = mlkem_prf_seeded(ETA1, r)
+	prf2 = mlkem_prf_seeded(ETA2, r)
+	rhat = ntt([
+		sample_poly_cbd(ETA1, prf1(i))
 		for i in range(K)
-	]
+	])
 	e1 = [
-		sample_poly_cbd(ETA2, mlkem_prf(ETA2, r, i+K))
+		sample_poly_cbd(ETA2, prf2(i+K))
 		for i in range(K)
 	]
-	e2 = sample_poly_cbd(ETA2, mlkem_prf(ETA2, r, 2*K))
+	e2 = sample_poly_cbd(ETA2, prf2(2*K))
 
-	u = [ # u = ntt-1(AT*r)+e1
-		poly256_add(ntt_inv(reduce(ntt_add, [
-			ntt_mul(ahat[i][j], rhat[j]) # note that i,j are reversed here
-			for j in range(K)
-		])), e1[i])
-		for i in range(K)
-	]
-	mu = decompress(1, byte_decode(1, m))
-	v = poly256_add(ntt_inv(reduce(ntt_add, [
-		ntt_mul(that[i], rhat[i])
-		for i in range(K)
-	])), poly256_add(e2, mu))
+	# u = ntt-1(AT*r)+e1 (note that i,j are reversed here, relative to keygen)
+	u = poly256_add(ntt_inv(ntt_matvec(ahat, rhat)), e1)
+	mu = unpack_compressed(1, m)
+	# v = ntt-1(tT*r)+e2+mu
+	v = poly256_add(ntt_inv(ntt_matvec([that], rhat)[0]), poly256_add(e2, mu))
 
-	c1 = b"".join(byte_encode(DU, compress(DU, u[i])) for i in range(K))
-	c2 = byte_encode(DV, compress(DV, v))
+	c1 = b"".join(pack_compressed(DU, u[i]) for i in range(K))
+	c2 = pack_compressed(DV, v)
 	return c1 + c2
 
 
@@ -254,18 +643,17 @@ def kpke_decrypt(dk_pke: bytes, c: bytes) -> bytes:
 	c1 = c[:32*DU*K]
 	c2 = c[32*DU*K:]
 	u = [
-		decompress(DU, byte_decode(DU, c1[i*32*DU:(i+1)*32*DU]))
+		unpack_compressed(DU, c1[i*32*DU:(i+1)*32*DU])
 		for i in range(K)
 	]
-	v = decompress(DV, byte_decode(DV, c2))
+	v = unpack_compressed(DV, c2)
 	shat = [byte_decode(12, dk_pke[i*384:(i+1)*384]) for i in range(K)]
 	# NOTE: the comment in FIPS203 seems wrong here?
 	# it says "NTT−1 and NTT invoked k times", but I think NTT−1 is only invoked once.
-	w = poly256_sub(v, ntt_inv(reduce(ntt_add, [
-		ntt_mul(shat[i], ntt(u[i]))
-		for i in range(K)
-	])))
-	m = byte_encode(1, compress(1, w))
+	# (we do all K of the NTTs in one go, and shat*uhat is a 1xK by K matvec)
+	uhat = ntt(u)
+	w = poly256_sub(v, ntt_inv(ntt_matvec([shat], uhat)[0]))
+	m = pack_compressed(1, w)
 	return m
 
 
@@ -316,12 +704,19 @@ if __name__ == "__main__":
 	ntt_res = ntt_inv(ntt_add(ntt(a), ntt(b)))
 	poly_res = poly256_add(a, b)
 
-	assert(ntt_res == poly_res)
+	assert(ntt_res.tolist() == poly_res.tolist())
 
 	ntt_prod = ntt_inv(ntt_mul(ntt(a), ntt(b)))
 	poly_prod = poly256_slow_mul(a, b)
 
-	assert(ntt_prod == poly_prod)
+	assert(ntt_prod.tolist() == poly_prod)
+
+	# the specialised byte_encode/byte_decode should match plain bit-by-bit packing
+	for d in (4, 10, 12):
+		f = np.arange(256) * 997 % 2**d
+		bits = (f[:, None] >> np.arange(d)) & 1
+		assert(byte_encode(d, f) == bits_to_bytes(bits.ravel()))
+		assert(byte_decode(d, byte_encode(d, f)).tolist() == f.tolist())
 
 
 	ek_pke, dk_pke = kpke_keygen(b"SEED"*8)
@@ -340,4 +735,10 @@ if __name__ == "__main__":
 	k2 = mlkem_decaps(c, dk)
 	print("decapsulated:", k2.hex())
 
-	assert(k1 == k2)
\ No newline at end of file
+	assert(k1 == k2)
+
+	# keys don't have to be bytes (the caches need hashable keys internally)
+	k3, c = mlkem_encaps(bytearray(ek))
+	assert(mlkem_decaps(c, bytearray(dk)) == k3)
+	k4, c = mlkem_encaps(memoryview(ek))
+	assert(mlkem_decaps(c, dk) == k4)
\ No newline at end of file
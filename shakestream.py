@@ -1,15 +1,27 @@
 # this is kinda gross. it exists to work around API limitations.
+# hashlib's SHAKE objects can't be squeezed incrementally, you can only ask for
+# a prefix of the output of a given length (which gets recomputed from scratch
+# each time). so we squeeze out as much as the read needs in one go, and at
+# least double the buffer whenever we run out, so the total work stays linear
+# (at most ~2x the output actually read, rather than quadratic).
+# in particular, a single big read up front (like sample_ntt does) only ever
+# squeezes once. (pycryptodome's SHAKE128 can squeeze incrementally, but it's
+# a good deal slower per call than hashlib, so it's not worth it here)
 class ShakeStream:
-	def __init__(self, digestfn) -> None:
-		# digestfn is anything we can call repeatedly with different lengths
-		self.digest = digestfn
-		self.buf = self.digest(32) # arbitrary starting length
+	def __init__(self, xof, blocksize: int=168) -> None:
+		# xof is a hashlib shake object (anything with a .digest(length) method)
+		# blocksize is its rate (168 for SHAKE-128). there's no point squeezing
+		# out partial blocks, so the buffer is always a multiple of it.
+		self.xof = xof
+		self.blocksize = blocksize
+		self.buf = b"" # nothing squeezed until the first read
 		self.offset = 0
 	
 	def read(self, n: int) -> bytes:
-		# double the buffer size until we have enough
-		while self.offset + n > len(self.buf):
-			self.buf = self.digest(len(self.buf) * 2)
+		if self.offset + n > len(self.buf):
+			length = max(self.offset + n, len(self.buf) * 2)
+			length += -length % self.blocksize
+			self.buf = self.xof.digest(length)
 		res = self.buf[self.offset:self.offset + n]
 		self.offset += n
 		return res
@@ -18,7 +30,21 @@ class ShakeStream:
 if __name__ == "__main__":
 	from hashlib import shake_128
 
-	a = ShakeStream(shake_128(b"hello").digest)
+	a = ShakeStream(shake_128(b"hello"))
 	foo = a.read(17) + a.read(5) + a.read(57) + a.read(1432) + a.read(48)
 	bar = shake_128(b"hello").digest(17 + 5 + 57 + 1432 + 48)
-	assert(foo == bar)
\ No newline at end of file
+	assert(foo == bar)
+
+	# reads that fit in the first squeeze (1000 bytes, rounded up to 1008) should only squeeze once
+	class CountingShake:
+		def __init__(self, xof) -> None:
+			self.xof = xof
+			self.calls = 0
+		def digest(self, length: int) -> bytes:
+			self.calls += 1
+			return self.xof.digest(length)
+
+	c = CountingShake(shake_128(b"hello"))
+	a = ShakeStream(c)
+	assert(a.read(1000) + a.read(8) == shake_128(b"hello").digest(1000 + 8))
+	assert(c.calls == 1)
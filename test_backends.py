@@ -0,0 +1,57 @@
+import importlib.util
+import os
+import sys
+import numpy as np
+import mlkem
+
+# the numba kernels and the pure-numpy versions they replace should agree.
+# mlkem has already picked the numba ones, so load a second copy of it with
+# numba hidden, to get the numpy ones too.
+
+if mlkem.numba is None:
+	print("numba not installed, nothing to compare")
+	sys.exit()
+
+saved = sys.modules["numba"]
+sys.modules["numba"] = None # makes "import numba" raise ImportError
+spec = importlib.util.spec_from_file_location("mlkem_numpy", mlkem.__file__)
+mlkem_numpy = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mlkem_numpy)
+sys.modules["numba"] = saved
+assert(mlkem_numpy.numba is None)
+
+rng = np.random.default_rng(0)
+
+def rand_poly(*shape):
+	return rng.integers(0, mlkem.Q, size=(*shape, 256), dtype=np.int32)
+
+def same(a, b):
+	return np.asarray(a).tolist() == np.asarray(b).tolist()
+
+for _ in range(100):
+	a, b = rand_poly(), rand_poly()
+	for name in ["poly256_add", "poly256_sub", "ntt_add", "ntt_mul"]:
+		assert(same(getattr(mlkem, name)(a, b), getattr(mlkem_numpy, name)(a, b))), name
+	for name in ["ntt", "ntt_inv"]:
+		assert(same(getattr(mlkem, name)(a), getattr(mlkem_numpy, name)(a))), name
+
+	# stacks of polynomials
+	x = rand_poly(mlkem.K)
+	y = rand_poly(mlkem.K)
+	A = rand_poly(mlkem.K, mlkem.K)
+	assert(same(mlkem.poly256_add(x, y), mlkem_numpy.poly256_add(x, y)))
+	assert(same(mlkem.poly256_sub(x, y), mlkem_numpy.poly256_sub(x, y)))
+	assert(same(mlkem.ntt(x), mlkem_numpy.ntt(x)))
+	assert(same(mlkem.ntt_inv(x), mlkem_numpy.ntt_inv(x)))
+	assert(same(mlkem.ntt_matvec(A, x), mlkem_numpy.ntt_matvec(A, x)))
+
+	for eta in [1, 2, 3]:
+		data = os.urandom(64 * eta)
+		assert(same(mlkem.sample_poly_cbd(eta, data), mlkem_numpy.sample_poly_cbd(eta, data)))
+
+# and the whole thing, end to end
+seed = b"SEED" * 8
+assert(mlkem.kpke_keygen(seed) == mlkem_numpy.kpke_keygen(seed))
+ek, dk = mlkem.mlkem_keygen()
+k, c = mlkem.mlkem_encaps(ek)
+assert(mlkem_numpy.mlkem_decaps(c, dk) == k)
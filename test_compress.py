@@ -1,5 +1,5 @@
 from fractions import Fraction
-from mlkem import compress, decompress, Q
+from mlkem import compress, decompress, pack_compressed, unpack_compressed, Q
 
 def round_half_up(n: Fraction) -> int:
 	return (n + Fraction(1, 2)).__floor__()
@@ -10,6 +10,11 @@ def compress_proper(d: int, x: int) -> int:
 def decompress_proper(d: int, y: int) -> int:
 	return round_half_up(Fraction(Q * y, 2**d)) % Q
 
+# bit-by-bit ByteEncode, straight from the spec
+def byte_encode_proper(d: int, f: list) -> bytes:
+	bits = [(a >> j) & 1 for a in f for j in range(d)]
+	return bytes(sum(bits[i+j] << j for j in range(8)) for i in range(0, len(bits), 8))
+
 # https://github.com/pq-crystals/kyber/blob/b628ba78711bc28327dc7d2d5c074a00f061884e/ref/poly.c#L191-L210
 def compress_kyber_ref_poly_tomsg(t: int) -> int:
 	t <<= 1
@@ -63,9 +68,23 @@ for d in range(12):
 	for n in range(2**d):
 		assert(decompress_proper(d, n) == decompress(d, [n])[0])
 
+# compress works on any integer, not just reduced ones
+x = list(range(-Q, 3 * Q))
+for d in range(12):
+	assert(compress(d, x).tolist() == [compress_proper(d, n) for n in x])
+
 for n in range(Q):
 	assert(compress_proper(1, n) == compress_kyber_ref_poly_tomsg(n))
 	assert(compress_proper(4, n) == compress_kyber_ref_poly_128(n))
 	assert(compress_proper(5, n) == compress_kyber_ref_poly_160(n))
 	assert(compress_proper(11, n) == compress_kyber_ref_polyvec_128(n))
-	assert(compress_proper(10, n) == compress_kyber_ref_polyvec_160(n))
\ No newline at end of file
+	assert(compress_proper(10, n) == compress_kyber_ref_polyvec_160(n))
+
+# the fused compress+encode and decode+decompress helpers
+for d in [1, 4, 10]:
+	for i in range(0, Q, 256):
+		x = [n % Q for n in range(i, i + 256)]
+		assert(pack_compressed(d, x) == byte_encode_proper(d, [compress_proper(d, n) for n in x]))
+	for i in range(0, 2**d, 256):
+		y = [n % 2**d for n in range(i, i + 256)]
+		assert(list(unpack_compressed(d, byte_encode_proper(d, y))) == [decompress_proper(d, n) for n in y])